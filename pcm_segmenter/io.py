@@ -1,5 +1,9 @@
-from typing import List
+from typing import Any, List
+import hashlib
+import os
 import pathlib
+import pickle
+import tempfile
 import vtk
 import pyCellAnalyst as pycell
 import pandas
@@ -22,6 +26,41 @@ def read_dataframe_from_excel(name: str, directory: str):
     return dataframe
 
 
+def read_regions_of_interest(filepath: str, start_col: int = 0) -> List[list]:
+    """
+    Read the bounding box rows of a region of interest spreadsheet, one row per chondron, in the same layout
+    expected by pyCellAnalyst.RegionsOfInterest.
+    :param filepath: Path to region of interest excel file
+    :param start_col: Column the bounding box definition starts at
+    :return:
+    """
+    dataframe = pandas.read_excel(pathlib.Path(filepath), engine="openpyxl")
+    return dataframe.iloc[:, start_col:].values.tolist()
+
+
+def directory_signature(directory: str) -> str:
+    """
+    Cheap signature of the contents of a directory from the names, sizes, and modification times of its files.
+    :param directory: Directory to sign
+    :return: Hex digest
+    """
+    signature = hashlib.sha256()
+    for filepath in sorted(pathlib.Path(directory).iterdir()):
+        if filepath.is_file():
+            stat = filepath.stat()
+            signature.update(f"{filepath.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return signature.hexdigest()
+
+
+def checkpoint_exists(name: str, directory: str) -> bool:
+    return pathlib.Path(directory).joinpath(f"{name}.pkl").is_file()
+
+
+def read_checkpoint(name: str, directory: str) -> Any:
+    with open(pathlib.Path(directory).joinpath(f"{name}.pkl"), "rb") as f:
+        return pickle.load(f)
+
+
 def write_image(image: pycell.Image, name: str, directory: str):
     image.writeAsVTK(name=pathlib.Path(directory).joinpath(name))
 
@@ -39,3 +78,33 @@ def write_results_to_excel(dataframe: pandas.DataFrame, name: str, directory: st
     filepath = pathlib.Path(directory).joinpath(f"{name}.xlsx")
     print(f"... Saving data to {filepath}")
     dataframe.to_excel(filepath, index=False)
+
+
+def write_results_to_csv(dataframe: pandas.DataFrame, name: str, directory: str):
+    filepath = pathlib.Path(directory).joinpath(f"{name}.csv")
+    print(f"... Saving data to {filepath}")
+    dataframe.to_csv(filepath, index=False)
+
+
+def write_checkpoint(obj: Any, name: str, directory: str):
+    """
+    Pickle obj to directory/name.pkl. The data is written to a temporary file in the same directory and then
+    renamed over the target, so an interrupted run never leaves a partially written checkpoint behind.
+    :param obj: Object to store
+    :param name: Checkpoint name without extension
+    :param directory: Directory to store checkpoint in
+    :return:
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    filepath = directory.joinpath(f"{name}.pkl")
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=f".{name}.", suffix=".tmp", delete=False) as f:
+        try:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, filepath)
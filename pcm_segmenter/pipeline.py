@@ -1,6 +1,8 @@
 import argparse
 import datetime
-from typing import Dict, Optional
+import pathlib
+import traceback
+from typing import Any, Dict, List, Optional
 
 import pandas
 from pyCellAnalyst import RegionsOfInterest
@@ -9,9 +11,15 @@ from pydantic import BaseModel
 from . import config, segment, analysis, io, postprocess
 
 
+CHECKPOINT_DIRECTORY = "checkpoints"
+ROI_START_COLUMN = 0
+FAILURE_COLUMNS = ["Directory", "Chondron", "Exception", "Message", "Traceback"]
+
+
 class PipelineResult(BaseModel):
     image_level_dataframes: Dict[str, pandas.DataFrame]
     aggregated_dataframe: pandas.DataFrame
+    failures: pandas.DataFrame
 
     class Config:
         arbitrary_types_allowed = True
@@ -21,12 +29,133 @@ def config_from_file(config_file: str):
     return config.parse_config(config_file)
 
 
+def _chondron_fingerprints(c: config.Config, i: int) -> List[Dict[str, Any]]:
+    """
+    Collect every input that affects the results of each chondron in image directory i. A checkpoint is only
+    reused when its stored fingerprint is equal to the one returned here for its chondron.
+    :param c: Configuration object
+    :param i: Index of image directory in configuration
+    :return: List of fingerprints, one per row of the region of interest file
+    """
+    fingerprint = {"ecm_image_directory": str(c.ecm_image_directories[i]),
+                   "ecm_image_signature": io.directory_signature(c.ecm_image_directories[i]),
+                   "cell_image_directory": str(c.cell_image_directories[i]),
+                   "cell_image_signature": io.directory_signature(c.cell_image_directories[i]),
+                   "image_spacing": [float(x) for x in c.image_spacing[i]],
+                   "surface_angle": float(c.surface_angles[i]),
+                   "bilateral_domain_sigma": float(c.bilateral_domain_sigma),
+                   "bilateral_range_sigma": float(c.bilateral_range_sigma),
+                   "equalization_window": [float(x) for x in c.equalization_window],
+                   "exponent": float(c.exponent),
+                   "diffusion_conductance": float(c.diffusion_conductance),
+                   "diffusion_iterations": int(c.diffusion_iterations)}
+    regions = io.read_regions_of_interest(c.regions_of_interest[i], start_col=ROI_START_COLUMN)
+    return [dict(fingerprint, region_of_interest=region) for region in regions]
+
+
+def _read_matching_checkpoint(checkpoint_directory: pathlib.Path, chondron_id: int, fingerprint: Dict[str, Any],
+                              output_directory: str) -> Optional[List[pandas.DataFrame]]:
+    """
+    Load the dataframes checkpointed for a chondron if they were created from the same inputs.
+    :return: Checkpointed dataframes, or None if the chondron must be recomputed
+    """
+    checkpoint_name = f"chondron{chondron_id:02d}"
+    if not io.checkpoint_exists(checkpoint_name, directory=checkpoint_directory):
+        return None
+    try:
+        checkpoint = io.read_checkpoint(checkpoint_name, directory=checkpoint_directory)
+    except Exception as e:
+        print(f"... Could not read checkpoint for chondron {chondron_id} in {output_directory}: {e!r}; recomputing")
+        return None
+    if not isinstance(checkpoint, dict) or checkpoint.get("fingerprint") != fingerprint:
+        print(f"... Checkpoint for chondron {chondron_id} in {output_directory} was created with different inputs; "
+              f"recomputing")
+        return None
+    print(f"... Resuming chondron {chondron_id} in {output_directory} from checkpoint")
+    return checkpoint["dataframes"]
+
+
+def _write_failures_report(failures: pandas.DataFrame, name: str):
+    """
+    Write the failures report to excel, falling back to csv if excel refuses its contents. Any report left by a
+    previous run in the other format is removed so it can not be mistaken for the current one.
+    """
+    excel_report = pathlib.Path(f"{name}.xlsx")
+    csv_report = pathlib.Path(f"{name}.csv")
+    try:
+        io.write_results_to_excel(failures, name=name, directory=".")
+        csv_report.unlink(missing_ok=True)
+    except Exception as e:
+        print(f"... Failed to save failures report as excel: {e!r}")
+        excel_report.unlink(missing_ok=True)
+        io.write_results_to_csv(failures, name=name, directory=".")
+
+
+def _failure_record(directory: str, chondron_id: Optional[int], e: Exception) -> Dict[str, Any]:
+    return {"Directory": directory,
+            "Chondron": chondron_id,
+            "Exception": type(e).__name__,
+            "Message": str(e),
+            "Traceback": traceback.format_exc()}
+
+
+def _process_chondron(ecm_roi_image, cell_roi_image, c: config.Config, i: int, chondron_id: int,
+                      save_contours: bool, save_thickness_polydata: bool) -> List[pandas.DataFrame]:
+    """
+    Segment a single chondron region of interest and calculate its PCM thicknesses.
+    :return: List of thickness dataframes, one per cell in the region of interest
+    """
+    ecm_smooth = segment.process_ecm(ecm_roi_image, conf=c)
+    cell_smooth = segment.process_cell(cell_roi_image, conf=c)
+
+    ecm_segmentation = segment.segment_ecm(ecm_smooth)
+    cell_segmentation = segment.segment_cell(cell_smooth)
+
+    if save_contours:
+        io.write_polydata(ecm_segmentation.isocontour, name=f"ecm_chondron{chondron_id:02d}",
+                          directory=c.output_directories[i])
+        io.write_polydata(cell_segmentation.isocontour, name=f"cell_chondron{chondron_id:02d}",
+                          directory=c.output_directories[i])
+
+    thickness_polydatas = analysis.calculate_thicknesses(cell_segmentation.isocontour,
+                                                         ecm_segmentation.isocontour,
+                                                         c.image_spacing[i], c.surface_angles[i])
+
+    chondron_dataframes = []
+    for cell_id, thickness_polydata in enumerate(thickness_polydatas):
+        if save_thickness_polydata:
+            io.write_polydata(thickness_polydata,
+                              name=f"thickness_chondron{chondron_id:02d}_cell{cell_id}",
+                              directory=c.output_directories[i])
+        chondron_dataframes.append(
+            postprocess.create_pandas_dataframe_from_polydata(thickness_polydata, cell_id=cell_id))
+    return chondron_dataframes
+
+
 def run(c: config.Config,
         save_image_level_thicknesses: bool = False,
         save_aggregated_dataframes: bool = True,
         save_contours: bool = False,
         save_thickness_polydata: bool = False,
-        aggregate_filename: Optional[str] = None):
+        aggregate_filename: Optional[str] = None,
+        resume: bool = False):
+    """
+    Segment and analyze every chondron region of interest defined in the configuration.
+
+    The results of each chondron are checkpointed to a checkpoints sub-folder of its output directory as soon as
+    they are complete, together with a fingerprint of the inputs that produced them. An exception raised while
+    loading an image directory, processing a chondron, or writing its checkpoint is recorded and the run continues
+    with the next one; all failures are written to a report (empty if nothing failed) before the aggregated results.
+    :param c: Configuration object
+    :param save_image_level_thicknesses: Write dataframe to excel file for each image directory
+    :param save_aggregated_dataframes: Write aggregated dataframe to excel file
+    :param save_contours: Write polydata to disk for all PCM isocontours
+    :param save_thickness_polydata: Write polydata to disk for all PCM thickness calculations
+    :param aggregate_filename: Filename for aggregate data
+    :param resume: Load checkpointed chondrons instead of recomputing them. Checkpoints created with different
+        inputs are recomputed.
+    :return:
+    """
     if aggregate_filename:
         aggregate_filename = f"pipeline_{aggregate_filename}"
     else:
@@ -34,53 +163,91 @@ def run(c: config.Config,
         aggregate_filename = now.strftime('pipeline_run_%m_%d_%H_%M')
 
     image_level_dataframes = {}
+    failures = []
     for i, ecm_image_directory in enumerate(c.ecm_image_directories):
-        ecm = io.read_image_stack(ecm_image_directory, spacing=c.image_spacing[i])
-        cell = io.read_image_stack(c.cell_image_directories[i], spacing=c.image_spacing[i])
+        try:
+            fingerprints = _chondron_fingerprints(c, i)
+        except Exception as e:
+            print(f"... Failed to read inputs for {c.output_directories[i]}: {e!r}")
+            failures.append(_failure_record(c.output_directories[i], None, e))
+            continue
+
+        checkpoint_directory = pathlib.Path(c.output_directories[i]).joinpath(CHECKPOINT_DIRECTORY)
+        checkpointed = {}
+        if resume:
+            for chondron_id, fingerprint in enumerate(fingerprints):
+                dataframes = _read_matching_checkpoint(checkpoint_directory, chondron_id, fingerprint,
+                                                       c.output_directories[i])
+                if dataframes is not None:
+                    checkpointed[chondron_id] = dataframes
+
+        roi_images = None
+        if len(checkpointed) < len(fingerprints):
+            try:
+                ecm = io.read_image_stack(ecm_image_directory, spacing=c.image_spacing[i])
+                cell = io.read_image_stack(c.cell_image_directories[i], spacing=c.image_spacing[i])
 
-        ecm_roi = RegionsOfInterest(ecm, regions_of_interest=c.regions_of_interest[i], start_col=0, slice2d=True)
-        cell_roi = RegionsOfInterest(cell, regions_of_interest=c.regions_of_interest[i], start_col=0, slice2d=True)
+                ecm_roi = RegionsOfInterest(ecm, regions_of_interest=c.regions_of_interest[i],
+                                            start_col=ROI_START_COLUMN, slice2d=True)
+                cell_roi = RegionsOfInterest(cell, regions_of_interest=c.regions_of_interest[i],
+                                             start_col=ROI_START_COLUMN, slice2d=True)
+                roi_images = list(zip(ecm_roi.images, cell_roi.images))
+                if len(roi_images) != len(fingerprints):
+                    raise ValueError(f"{c.regions_of_interest[i]} defines {len(fingerprints)} regions of interest "
+                                     f"but {len(roi_images)} were extracted")
+            except Exception as e:
+                roi_images = None
+                print(f"... Failed to load images for {c.output_directories[i]}: {e!r}")
+                failures.append(_failure_record(c.output_directories[i], None, e))
 
         image_level_dataframe = []
-        total_cell_count = 0
-        for chondron_id, (ecm_roi_image, cell_roi_image) in enumerate(zip(ecm_roi.images, cell_roi.images)):
-            ecm_smooth = segment.process_ecm(ecm_roi_image, conf=c)
-            cell_smooth = segment.process_cell(cell_roi_image, conf=c)
-
-            ecm_segmentation = segment.segment_ecm(ecm_smooth)
-            cell_segmentation = segment.segment_cell(cell_smooth)
-
-            if save_contours:
-                io.write_polydata(ecm_segmentation.isocontour, name=f"ecm_chondron{chondron_id:02d}",
-                                  directory=c.output_directories[i])
-                io.write_polydata(cell_segmentation.isocontour, name=f"cell_chondron{chondron_id:02d}",
-                                  directory=c.output_directories[i])
-
-            thickness_polydatas = analysis.calculate_thicknesses(cell_segmentation.isocontour,
-                                                                 ecm_segmentation.isocontour,
-                                                                 c.image_spacing[i], c.surface_angles[i])
-
-            for cell_id, thickness_polydata in enumerate(thickness_polydatas):
-                if save_thickness_polydata:
-                    io.write_polydata(thickness_polydata,
-                                      name=f"thickness_chondron{chondron_id:02d}_cell{cell_id}",
-                                      directory=c.output_directories[i])
-                image_level_dataframe.append(
-                    postprocess.create_pandas_dataframe_from_polydata(thickness_polydata,
-                                                                      cell_id=cell_id + total_cell_count))
+        for chondron_id, fingerprint in enumerate(fingerprints):
+            if chondron_id in checkpointed:
+                image_level_dataframe.extend(checkpointed[chondron_id])
+                continue
+            if roi_images is None:
+                continue
+            ecm_roi_image, cell_roi_image = roi_images[chondron_id]
+            try:
+                chondron_dataframes = _process_chondron(ecm_roi_image, cell_roi_image, c, i, chondron_id,
+                                                        save_contours, save_thickness_polydata)
+            except Exception as e:
+                print(f"... Failed chondron {chondron_id} in {c.output_directories[i]}: {e!r}")
+                failures.append(_failure_record(c.output_directories[i], chondron_id, e))
+                continue
+            try:
+                io.write_checkpoint({"fingerprint": fingerprint, "dataframes": chondron_dataframes},
+                                    name=f"chondron{chondron_id:02d}", directory=checkpoint_directory)
+            except Exception as e:
+                print(f"... Failed to checkpoint chondron {chondron_id} in {c.output_directories[i]}: {e!r}")
+                failures.append(_failure_record(c.output_directories[i], chondron_id, e))
+            image_level_dataframe.extend(chondron_dataframes)
 
+        if not image_level_dataframe:
+            continue
         image_level_dataframes[c.output_directories[i]] = postprocess.concatenate_pandas_dataframes(
             image_level_dataframe)
         if save_image_level_thicknesses:
-            io.write_results_to_excel(image_level_dataframes[c.output_directories[i]],
-                                      name=f"thicknesses",
-                                      directory=c.output_directories[i])
+            try:
+                io.write_results_to_excel(image_level_dataframes[c.output_directories[i]],
+                                          name=f"thicknesses",
+                                          directory=c.output_directories[i])
+            except Exception as e:
+                print(f"... Failed to save thicknesses for {c.output_directories[i]}: {e!r}")
+                failures.append(_failure_record(c.output_directories[i], None, e))
+
+    failures = pandas.DataFrame(failures, columns=FAILURE_COLUMNS)
+    if not failures.empty:
+        print(f"... {len(failures)} failure(s); rerun with resume to retry only these")
+    _write_failures_report(failures, name=f"{aggregate_filename}_failures")
+
     aggregated_dataframe = postprocess.concatenate_pandas_dataframes(image_level_dataframes.values())
     if save_aggregated_dataframes:
         io.write_results_to_excel(aggregated_dataframe, name=aggregate_filename, directory=".")
 
     results = PipelineResult(image_level_dataframes=image_level_dataframes,
-                             aggregated_dataframe=aggregated_dataframe)
+                             aggregated_dataframe=aggregated_dataframe,
+                             failures=failures)
     return results
 
 
@@ -95,6 +262,8 @@ if __name__ == "__main__":
                         help="Write polydata to disk for all PCM isocontours")
     parser.add_argument("--save_polydata", action="store_true",
                         help="Write polydata to disk for all PCM thickness calculations")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip chondrons already checkpointed by a previous run of this configuration")
 
     args = parser.parse_args()
 
@@ -104,4 +273,5 @@ if __name__ == "__main__":
         aggregate_filename=args.aggregate_filename[0],
         save_image_level_thicknesses=args.save_thicknesses,
         save_contours=args.save_contours,
-        save_thickness_polydata=args.save_polydata)
+        save_thickness_polydata=args.save_polydata,
+        resume=args.resume)
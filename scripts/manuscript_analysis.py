@@ -1,4 +1,6 @@
+import argparse
 import sys
+import traceback
 sys.path.append("..")
 from pcm_segmenter import pipeline
 
@@ -9,9 +11,23 @@ CONFIGURATION_FILES = ("../configs/2018-06-13.yaml",
                        "../configs/2018-09-21.yaml",
                        "../configs/2018-10-04.yaml")
 
+parser = argparse.ArgumentParser(description="Run the segmentation and analysis for all manuscript configurations.")
+parser.add_argument("--resume", action="store_true",
+                    help="Skip chondrons already checkpointed by a previous run of each configuration")
+args = parser.parse_args()
 
+
+failed_configurations = []
 for config_file in CONFIGURATION_FILES:
     aggregate_filename = config_file.split("/")[-1].replace(".yaml", "")
-    configuration = pipeline.config_from_file(config_file)
-    pipeline.run(configuration, aggregate_filename=aggregate_filename,
-                 save_contours=True, save_thickness_polydata=True)
+    try:
+        configuration = pipeline.config_from_file(config_file)
+        pipeline.run(configuration, aggregate_filename=aggregate_filename,
+                     save_contours=True, save_thickness_polydata=True, resume=args.resume)
+    except Exception:
+        traceback.print_exc()
+        failed_configurations.append(config_file)
+
+if failed_configurations:
+    print(f"... Failed configurations: {', '.join(failed_configurations)}")
+    sys.exit(1)
@@ -0,0 +1,15 @@
+import pathlib
+import sys
+import types
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+try:
+    import pyCellAnalyst
+except ImportError:
+    # pyCellAnalyst is only distributed through conda. The tests never call into it, so a module providing the
+    # names used in annotations at import time is enough to exercise the pipeline bookkeeping.
+    pyCellAnalyst = types.ModuleType("pyCellAnalyst")
+    for name in ("Image", "FloatImage", "EightBitImage", "Segmentation", "RegionsOfInterest"):
+        setattr(pyCellAnalyst, name, type(name, (), {}))
+    sys.modules["pyCellAnalyst"] = pyCellAnalyst
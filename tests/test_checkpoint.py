@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from pcm_segmenter import io
+
+
+def test_checkpoint_round_trip(tmp_path):
+    directory = tmp_path.joinpath("checkpoints")
+    assert not io.checkpoint_exists("chondron00", directory=directory)
+
+    io.write_checkpoint({"fingerprint": {"exponent": 1.1}, "dataframes": [1, 2]}, name="chondron00",
+                        directory=directory)
+
+    assert io.checkpoint_exists("chondron00", directory=directory)
+    assert io.read_checkpoint("chondron00", directory=directory) == {"fingerprint": {"exponent": 1.1},
+                                                                     "dataframes": [1, 2]}
+
+
+def test_failed_checkpoint_leaves_no_files(tmp_path):
+    with pytest.raises(Exception):
+        io.write_checkpoint(lambda: None, name="chondron00", directory=tmp_path)
+
+    assert not io.checkpoint_exists("chondron00", directory=tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_checkpoint_replaces_existing(tmp_path):
+    io.write_checkpoint("first", name="chondron00", directory=tmp_path)
+    io.write_checkpoint("second", name="chondron00", directory=tmp_path)
+
+    assert io.read_checkpoint("chondron00", directory=tmp_path) == "second"
+    assert [p.name for p in tmp_path.iterdir()] == ["chondron00.pkl"]
+
+
+def test_directory_signature_tracks_file_contents(tmp_path):
+    image = tmp_path.joinpath("image_000.tif")
+    image.write_bytes(b"0" * 8)
+    signature = io.directory_signature(tmp_path)
+    assert io.directory_signature(tmp_path) == signature
+
+    image.write_bytes(b"0" * 16)
+    assert io.directory_signature(tmp_path) != signature
+
+    signature = io.directory_signature(tmp_path)
+    os.utime(image, ns=(0, 0))
+    assert io.directory_signature(tmp_path) != signature
@@ -0,0 +1,188 @@
+import pandas
+import pytest
+
+from pcm_segmenter import config, io, pipeline
+
+NUMBER_OF_CHONDRONS = 3
+
+
+class FakeRegionsOfInterest:
+    def __init__(self, image, regions_of_interest, start_col, slice2d):
+        regions = io.read_regions_of_interest(regions_of_interest, start_col=start_col)
+        self.images = [f"{image}_{chondron_id}" for chondron_id in range(len(regions))]
+
+
+def _write_regions_of_interest(filepath, shift=0):
+    rows = [[10 * chondron_id + shift, 10 * chondron_id, 0, 8, 8, 1] for chondron_id in range(NUMBER_OF_CHONDRONS)]
+    pandas.DataFrame(rows, columns=["x", "y", "z", "width", "height", "depth"]).to_excel(filepath, index=False)
+
+
+@pytest.fixture
+def conf(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(io, "read_image_stack", lambda directory, spacing: directory)
+    monkeypatch.setattr(pipeline, "RegionsOfInterest", FakeRegionsOfInterest)
+    for region in ("region_1", "region_2"):
+        for channel in ("C001", "C002"):
+            tmp_path.joinpath(region, channel).mkdir(parents=True)
+            tmp_path.joinpath(region, channel, "image_000.tif").write_bytes(b"0" * 8)
+        _write_regions_of_interest(tmp_path.joinpath(region, "selected_region.xlsx"))
+    return config.Config(regions_of_interest=["region_1/selected_region.xlsx", "region_2/selected_region.xlsx"],
+                         ecm_image_directories=["region_1/C002", "region_2/C002"],
+                         cell_image_directories=["region_1/C001", "region_2/C001"],
+                         output_directories=[str(tmp_path.joinpath("results", "region_1")),
+                                             str(tmp_path.joinpath("results", "region_2"))],
+                         image_spacing=[[1.0, 1.0, 1.0], [1.0, 1.0, 1.0]],
+                         surface_angles=[0.0, 0.0])
+
+
+def _record_calls(monkeypatch, fail=()):
+    calls = []
+
+    def process_chondron(ecm_roi_image, cell_roi_image, c, i, chondron_id, save_contours, save_thickness_polydata):
+        calls.append((i, chondron_id))
+        if (i, chondron_id) in fail:
+            raise UnboundLocalError("local variable 'data' referenced before assignment")
+        return [pandas.DataFrame({"Cell": [0, 0], "Thickness": [float(chondron_id), 1.0], "Region": [0, 1]})]
+
+    monkeypatch.setattr(pipeline, "_process_chondron", process_chondron)
+    return calls
+
+
+def _read_failures(tmp_path):
+    return io.read_dataframe_from_excel(name="pipeline_test_failures.xlsx", directory=tmp_path)
+
+
+def test_chondron_failure_is_isolated(conf, tmp_path, monkeypatch):
+    _record_calls(monkeypatch, fail=[(0, 1)])
+
+    results = pipeline.run(conf, aggregate_filename="test")
+
+    assert len(results.failures) == 1
+    assert results.failures.loc[0, "Directory"] == conf.output_directories[0]
+    assert results.failures.loc[0, "Chondron"] == 1
+    assert results.failures.loc[0, "Exception"] == "UnboundLocalError"
+    assert results.aggregated_dataframe["Cell"].nunique() == 2 * NUMBER_OF_CHONDRONS - 1
+    assert len(_read_failures(tmp_path)) == 1
+
+
+def test_resume_skips_checkpointed_chondrons(conf, tmp_path, monkeypatch):
+    _record_calls(monkeypatch, fail=[(0, 1)])
+    first = pipeline.run(conf, aggregate_filename="test")
+
+    calls = _record_calls(monkeypatch)
+    results = pipeline.run(conf, aggregate_filename="test", resume=True)
+
+    assert calls == [(0, 1)]
+    assert results.failures.empty
+    assert _read_failures(tmp_path).empty
+    assert results.aggregated_dataframe["Cell"].nunique() == 2 * NUMBER_OF_CHONDRONS
+    assert len(results.aggregated_dataframe) == len(first.aggregated_dataframe) + 2
+
+
+def test_resume_recomputes_when_inputs_change(conf, monkeypatch):
+    _record_calls(monkeypatch)
+    pipeline.run(conf, aggregate_filename="test")
+
+    calls = _record_calls(monkeypatch)
+    pipeline.run(conf.copy(update={"exponent": 2.0}), aggregate_filename="test", resume=True)
+
+    assert len(calls) == 2 * NUMBER_OF_CHONDRONS
+
+
+def test_resume_recomputes_edited_regions_of_interest(conf, tmp_path, monkeypatch):
+    _record_calls(monkeypatch)
+    pipeline.run(conf, aggregate_filename="test")
+
+    regions_of_interest = tmp_path.joinpath(conf.regions_of_interest[0])
+    rows = pandas.read_excel(regions_of_interest, engine="openpyxl")
+    rows.loc[1, "width"] += 2
+    rows.to_excel(regions_of_interest, index=False)
+
+    calls = _record_calls(monkeypatch)
+    pipeline.run(conf, aggregate_filename="test", resume=True)
+
+    assert calls == [(0, 1)]
+
+    _write_regions_of_interest(regions_of_interest, shift=1)
+    calls = _record_calls(monkeypatch)
+    pipeline.run(conf, aggregate_filename="test", resume=True)
+
+    assert calls == [(0, chondron_id) for chondron_id in range(NUMBER_OF_CHONDRONS)]
+
+
+def test_resume_recomputes_replaced_images(conf, tmp_path, monkeypatch):
+    _record_calls(monkeypatch)
+    pipeline.run(conf, aggregate_filename="test")
+
+    tmp_path.joinpath(conf.cell_image_directories[1], "image_000.tif").write_bytes(b"1" * 16)
+    calls = _record_calls(monkeypatch)
+    pipeline.run(conf, aggregate_filename="test", resume=True)
+
+    assert calls == [(1, chondron_id) for chondron_id in range(NUMBER_OF_CHONDRONS)]
+
+
+def test_resume_does_not_load_fully_checkpointed_images(conf, monkeypatch):
+    _record_calls(monkeypatch)
+    first = pipeline.run(conf, aggregate_filename="test")
+
+    def read_image_stack(directory, spacing):
+        raise MemoryError(directory)
+
+    monkeypatch.setattr(io, "read_image_stack", read_image_stack)
+    calls = _record_calls(monkeypatch)
+    results = pipeline.run(conf, aggregate_filename="test", resume=True)
+
+    assert calls == []
+    assert results.failures.empty
+    pandas.testing.assert_frame_equal(results.aggregated_dataframe, first.aggregated_dataframe)
+
+
+def test_image_load_failure_is_isolated(conf, monkeypatch):
+    def read_image_stack(directory, spacing):
+        if directory.startswith("region_1"):
+            raise FileNotFoundError(directory)
+        return directory
+
+    monkeypatch.setattr(io, "read_image_stack", read_image_stack)
+    calls = _record_calls(monkeypatch)
+
+    results = pipeline.run(conf, aggregate_filename="test")
+
+    assert calls == [(1, chondron_id) for chondron_id in range(NUMBER_OF_CHONDRONS)]
+    assert len(results.failures) == 1
+    assert pandas.isnull(results.failures.loc[0, "Chondron"])
+    assert results.failures.loc[0, "Exception"] == "FileNotFoundError"
+    assert list(results.image_level_dataframes) == [conf.output_directories[1]]
+
+
+def test_checkpoint_write_failure_is_isolated(conf, monkeypatch):
+    def write_checkpoint(obj, name, directory):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(io, "write_checkpoint", write_checkpoint)
+    _record_calls(monkeypatch)
+
+    results = pipeline.run(conf, aggregate_filename="test")
+
+    assert len(results.failures) == 2 * NUMBER_OF_CHONDRONS
+    assert set(results.failures["Exception"]) == {"OSError"}
+    assert results.aggregated_dataframe["Cell"].nunique() == 2 * NUMBER_OF_CHONDRONS
+
+
+def test_failures_report_falls_back_to_csv(conf, tmp_path, monkeypatch):
+    _record_calls(monkeypatch, fail=[(0, 1)])
+    write_results_to_excel = io.write_results_to_excel
+
+    def refuse_failures_report(dataframe, name, directory):
+        if name.endswith("_failures"):
+            raise ValueError("Cannot convert to excel")
+        write_results_to_excel(dataframe, name, directory)
+
+    monkeypatch.setattr(io, "write_results_to_excel", refuse_failures_report)
+
+    pipeline.run(conf, aggregate_filename="test")
+
+    assert len(pandas.read_csv(tmp_path.joinpath("pipeline_test_failures.csv"))) == 1
+    assert not tmp_path.joinpath("pipeline_test_failures.xlsx").exists()
+    assert tmp_path.joinpath("pipeline_test.xlsx").exists()